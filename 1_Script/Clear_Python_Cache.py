@@ -12,9 +12,13 @@ clean_project_cache.py - 清理项目缓存文件和目录
 """
 
 import os
+import sys
 import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import fnmatch
+import re
 
 # ==================== 配置区 ====================
 
@@ -41,39 +45,130 @@ FILES_TO_CLEAN = [
     "tmpclaude-*",     # Claude 生成的临时文件
 ]
 
-# 要保护的目录（不进入扫描，避免误删）
-PROTECTED_DIRS = [
+# 要保护的目录（不进入扫描，避免误删；只支持精确名称）
+PROTECTED_DIRS = frozenset({
     ".git",            # Git 仓库
     ".venv",           # 虚拟环境
     "venv",            # 虚拟环境
     "node_modules",    # Node.js 依赖（如果需要保留）
     "backup",          # 备份目录
-]
+})
+
+# 单次删除命令最多携带的路径数（避免超过 ARG_MAX）
+RM_BATCH_SIZE = 500
+
+# 输出缓冲行数，累计到该数量后一次性写出
+OUTPUT_BATCH_LINES = 512
+
+# 逐项进度最多输出的行数（项目过多时按间隔抽样显示）
+MAX_PROGRESS_LINES = 1000
+
+# ==================== 模式预处理 ====================
+
+_GLOB_CHARS = "*?["
+
+
+def compile_globs(globs):
+    """把多个通配符模式合并成一个正则，一次 match 完成匹配；无模式时返回 None"""
+    if not globs:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(g)})" for g in globs))
+
+
+def split_patterns(patterns):
+    """将模式列表拆分为 (精确名称集合, 扩展名元组, 通配符合并正则)"""
+    exact = frozenset(p for p in patterns if not any(c in p for c in _GLOB_CHARS))
+    exts = tuple(
+        p[1:] for p in patterns
+        if p.startswith("*.") and not any(c in p[2:] for c in _GLOB_CHARS)
+    )
+    globs = [
+        p for p in patterns
+        if p not in exact and not (p.startswith("*.") and p[1:] in exts)
+    ]
+    return exact, exts, compile_globs(globs)
 
-# ==================== 功能函数 ====================
 
-def match_pattern(name, patterns):
-    """检查名称是否匹配任一模式"""
-    for pattern in patterns:
-        if fnmatch.fnmatch(name, pattern):
-            return True
-    return False
+def build_matcher(patterns):
+    """根据模式列表生成专用匹配函数
+
+    拆分后的精确名称和扩展名作为常量直接写进生成的函数体，
+    匹配时不再逐项解释模式列表。
+    """
+    exact, exts, globs_re = split_patterns(patterns)
+    lines = ["def match(name):"]
+    if exact:
+        lines.append(f"    if name in {set(exact)!r}: return True")
+    if exts:
+        lines.append(f"    if name.endswith({exts!r}): return True")
+    if globs_re is not None:
+        lines.append("    if _globs_match(name) is not None: return True")
+    lines.append("    return False")
+
+    namespace = {"_globs_match": globs_re.match if globs_re is not None else None}
+    exec("\n".join(lines), namespace)
+    return namespace["match"]
+
+
+# 导入时为每个配置列表生成一次匹配函数
+match_dir_to_clean = build_matcher(DIRS_TO_CLEAN)
+match_file_to_clean = build_matcher(FILES_TO_CLEAN)
+
+# ==================== 功能函数 ====================
 
 
 def get_dir_size(path):
-    """计算目录大小（字节）"""
+    """计算目录大小（字节），用显式栈代替递归，复用 DirEntry 缓存的类型和 stat 信息"""
     total_size = 0
-    try:
-        for entry in os.scandir(path):
-            if entry.is_file():
-                total_size += entry.stat().st_size
-            elif entry.is_dir():
-                total_size += get_dir_size(entry.path)
-    except Exception:
-        pass
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total_size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
     return total_size
 
 
+def _scan(path):
+    """基于 os.scandir 遍历目录，产出 (类型, 路径, 大小)
+
+    跳过保护目录；匹配到待清理目录时不再深入，其大小由调用方另行计算（记为 0），
+    因此每棵子树只会被遍历一次。
+    """
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # 保护目录不进入扫描
+                    if entry.name in PROTECTED_DIRS:
+                        continue
+                    # 已标记删除的目录无需深入
+                    if match_dir_to_clean(entry.name):
+                        yield "dir", entry.path, 0
+                        continue
+                    yield from _scan(entry.path)
+                elif entry.is_file(follow_symlinks=False) or entry.is_symlink():
+                    # 符号链接（含指向目录或已失效的）按文件处理，只删除链接本身，大小取 lstat
+                    if match_file_to_clean(entry.name):
+                        yield "file", entry.path, entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+
+
 def format_size(size_bytes):
     """格式化显示文件大小"""
     if size_bytes == 0:
@@ -88,6 +183,23 @@ def format_size(size_bytes):
         return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
 
 
+def is_network_path(path):
+    """检查路径是否是网络路径（UNC 或映射的网络驱动器）"""
+    if str(path).startswith('\\\\'):
+        return True
+    try:
+        return os.path.realpath(path).startswith('\\\\')
+    except OSError:
+        return False
+
+
+def _size_workers(path):
+    """计算目录大小的线程数：stat 会释放 GIL，网络路径延迟高，用更多线程"""
+    if is_network_path(path):
+        return 64
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
 def collect_cache_items():
     """收集所有要清理的缓存项目"""
     target_dirs = []
@@ -97,38 +209,96 @@ def collect_cache_items():
     print(f"正在扫描项目缓存...")
     print(f"起点: {os.path.abspath('.')}\n")
 
-    # 扫描所有文件和目录
-    for root, dirs, files in os.walk('.'):
-        # 过滤掉保护目录，不进入扫描
-        dirs[:] = [d for d in dirs if not match_pattern(d, PROTECTED_DIRS)]
-
-        # 查找匹配的目录
-        for dir_name in dirs[:]:  # 使用副本遍历，因为可能修改原列表
-            if match_pattern(dir_name, DIRS_TO_CLEAN):
-                dir_path = os.path.join(root, dir_name)
-                size = get_dir_size(dir_path)
-                target_dirs.append((dir_path, size))
+    # 扫描所有文件和目录；匹配目录的大小交给线程池并行计算，与扫描重叠
+    with ThreadPoolExecutor(max_workers=_size_workers('.')) as executor:
+        futures = {}
+        for kind, path, size in _scan('.'):
+            if kind == "dir":
+                futures[executor.submit(get_dir_size, path)] = len(target_dirs)
+                target_dirs.append((path, 0))
+            else:
+                # _scan 不会进入已标记删除的目录，这里的文件不会被重复计算
+                target_files.append((path, size))
                 total_size += size
-                # 从遍历列表中移除（已标记删除，无需深入）
-                dirs.remove(dir_name)
-
-        # 查找匹配的文件
-        for file_name in files:
-            if match_pattern(file_name, FILES_TO_CLEAN):
-                file_path = os.path.join(root, file_name)
-                # 跳过已标记删除目录中的文件（避免重复计算）
-                parent_dir = os.path.basename(root)
-                if not match_pattern(parent_dir, DIRS_TO_CLEAN):
-                    try:
-                        size = os.path.getsize(file_path)
-                        target_files.append((file_path, size))
-                        total_size += size
-                    except Exception:
-                        pass
+
+        for future in as_completed(futures):
+            index = futures[future]
+            size = future.result()
+            target_dirs[index] = (target_dirs[index][0], size)
+            total_size += size
 
     return target_dirs, target_files, total_size
 
 
+def _run_batched(cmd, paths):
+    """分批执行删除命令，返回 stderr 输出行"""
+    errors = []
+    for i in range(0, len(paths), RM_BATCH_SIZE):
+        r = subprocess.run(
+            [*cmd, "--", *paths[i:i + RM_BATCH_SIZE]],
+            capture_output=True, text=True,
+        )
+        errors.extend(r.stderr.splitlines())
+    return errors
+
+
+def _fast_rmtree(paths):
+    """批量删除目录：POSIX 下一次 rm -rf，Windows 下逐个 shutil.rmtree，返回错误信息"""
+    if not paths:
+        return []
+    if os.name != "nt":
+        return _run_batched(["rm", "-rf"], paths)
+
+    errors = []
+
+    def on_exc(func, p, exc):
+        # 已不存在的路径视为删除成功；其余错误累积下来，不中断本次遍历
+        if not isinstance(exc, FileNotFoundError):
+            errors.append(f"{p}: {exc}")
+
+    # 不经过 cmd.exe（rd /s /q）：路径中的 & | ^ % 会被 cmd 当作元字符解释
+    for path in paths:
+        if sys.version_info >= (3, 12):
+            shutil.rmtree(path, onexc=on_exc)
+        else:
+            shutil.rmtree(path, onerror=lambda func, p, exc_info: on_exc(func, p, exc_info[1]))
+    return errors
+
+
+def _fast_remove(paths):
+    """批量删除文件：POSIX 下一次 rm -f，Windows 下逐个 os.remove，返回错误信息"""
+    if not paths:
+        return []
+    if os.name != "nt":
+        return _run_batched(["rm", "-f"], paths)
+
+    errors = []
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            errors.append(f"{path}: {e}")
+    return errors
+
+
+def _find_error(errors, path):
+    """从删除命令的错误输出中找出与路径相关的信息。
+    路径须作为完整片段出现（其后为引号、冒号、分隔符或行尾），避免 x/a 匹配到 x/ab 的错误"""
+    if not errors:
+        return "删除失败"
+    pattern = re.compile(r"(?:^|[\s'\"‘])" + re.escape(path) + r"(?=$|[\s'\"’:/\\])")
+    return next((e for e in errors if pattern.search(e)), "删除失败")
+
+
+def _write_lines(lines, force=False):
+    """批量输出：累计到 OUTPUT_BATCH_LINES 行或 force 时一次性写出"""
+    if lines and (force or len(lines) >= OUTPUT_BATCH_LINES):
+        sys.stdout.write("\n".join(lines) + "\n")
+        lines.clear()
+
+
 def display_items(target_dirs, target_files, total_size):
     """显示要清理的项目"""
     print("=" * 80)
@@ -142,21 +312,25 @@ def display_items(target_dirs, target_files, total_size):
     print(f"\n[发现的缓存内容] (总计: {format_size(total_size)})")
     print("-" * 80)
 
+    lines = []
+
     # 显示目录
     if target_dirs:
-        print(f"\n📁 目录 ({len(target_dirs)} 个):")
+        lines.append(f"\n📁 目录 ({len(target_dirs)} 个):")
         for dir_path, size in target_dirs[:50]:  # 最多显示50个
-            print(f"  {dir_path} ({format_size(size)})")
+            lines.append(f"  {dir_path} ({format_size(size)})")
         if len(target_dirs) > 50:
-            print(f"  ... 还有 {len(target_dirs) - 50} 个目录")
+            lines.append(f"  ... 还有 {len(target_dirs) - 50} 个目录")
 
     # 显示文件
     if target_files:
-        print(f"\n📄 文件 ({len(target_files)} 个):")
+        lines.append(f"\n📄 文件 ({len(target_files)} 个):")
         for file_path, size in target_files[:50]:  # 最多显示50个
-            print(f"  {file_path} ({format_size(size)})")
+            lines.append(f"  {file_path} ({format_size(size)})")
         if len(target_files) > 50:
-            print(f"  ... 还有 {len(target_files) - 50} 个文件")
+            lines.append(f"  ... 还有 {len(target_files) - 50} 个文件")
+
+    _write_lines(lines, force=True)
 
     print("-" * 80)
     print(f"总计: {len(target_dirs)} 个目录, {len(target_files)} 个文件")
@@ -183,27 +357,41 @@ def clean_items(target_dirs, target_files, total_size):
     count_files = 0
     failed_items = []
 
-    # 删除目录
+    # 输出缓冲，成功项按间隔抽样显示，失败项全部显示
+    lines = []
+    step = max(1, (len(target_dirs) + len(target_files)) // MAX_PROGRESS_LINES)
+    index = 0
+
+    # 删除目录（批量交给系统命令，避免逐个 shutil.rmtree；删除命令自行处理已不存在的路径，
+    # 无需事先 os.path.exists，删除后仍存在的即为失败）
+    errors = _fast_rmtree([p for p, _ in target_dirs])
     for dir_path, size in target_dirs:
-        try:
-            if os.path.exists(dir_path):
-                shutil.rmtree(dir_path)
-                print(f"  ✓ [目录] {dir_path} ({format_size(size)})")
-                count_dirs += 1
-        except Exception as e:
-            print(f"  ✗ [错误] {dir_path}: {e}")
-            failed_items.append((dir_path, str(e)))
+        if os.path.lexists(dir_path):
+            error = _find_error(errors, dir_path)
+            lines.append(f"  ✗ [错误] {dir_path}: {error}")
+            failed_items.append((dir_path, error))
+        else:
+            if index % step == 0:
+                lines.append(f"  ✓ [目录] {dir_path} ({format_size(size)})")
+            count_dirs += 1
+        index += 1
+        _write_lines(lines)
 
     # 删除文件
+    errors = _fast_remove([p for p, _ in target_files])
     for file_path, size in target_files:
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"  ✓ [文件] {file_path} ({format_size(size)})")
-                count_files += 1
-        except Exception as e:
-            print(f"  ✗ [错误] {file_path}: {e}")
-            failed_items.append((file_path, str(e)))
+        if os.path.lexists(file_path):
+            error = _find_error(errors, file_path)
+            lines.append(f"  ✗ [错误] {file_path}: {error}")
+            failed_items.append((file_path, error))
+        else:
+            if index % step == 0:
+                lines.append(f"  ✓ [文件] {file_path} ({format_size(size)})")
+            count_files += 1
+        index += 1
+        _write_lines(lines)
+
+    _write_lines(lines, force=True)
 
     # 显示结果
     print("-" * 80)
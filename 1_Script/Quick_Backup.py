@@ -8,12 +8,26 @@ backup.py - 项目备份脚本
 """
 
 import os
+import sys
+import mmap
+import queue
+import shutil
+import stat
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import fnmatch
+import re
 import glob
 
+# 可选依赖：isal 提供 SIMD 加速的 deflate 和 CRC32，未安装时回退到标准库 zlib
+try:
+    from isal import isal_zlib as _zlib
+except ImportError:
+    import zlib as _zlib
+
 # ==================== 常量配置 ====================
 
 # 压缩包后缀名称
@@ -54,24 +68,104 @@ FILES_TO_SKIP = [
     "*.db",
 ]
 
+# 已压缩格式，直接存储不再 deflate
+_INCOMPRESSIBLE = frozenset({
+    ".zip", ".gz", ".xz", ".bz2", ".7z",
+    ".png", ".jpg", ".jpeg", ".webp",
+    ".mp4", ".mkv",
+    ".whl", ".pdf",
+})
+
+# 超过该大小的文件以 1 MiB 块流式写入
+_STREAM_THRESHOLD = 4 * 1024 * 1024
+_COPY_BUFFER = 1024 * 1024
+
+# 超过该大小的文件通过 mmap 读取后压缩
+_MMAP_THRESHOLD = 64 * 1024
+
+# 输出缓冲行数，累计到该数量后一次性写出
+OUTPUT_BATCH_LINES = 512
+
+# 打包进度最多输出的行数（文件过多时按间隔抽样显示）
+MAX_PROGRESS_LINES = 1000
+
+# ==================== 模式预处理 ====================
+
+_GLOB_CHARS = "*?["
+
+
+def compile_globs(globs):
+    """把多个通配符模式合并成一个正则，一次 match 完成匹配；无模式时返回 None"""
+    if not globs:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(g)})" for g in globs))
+
+
+def split_patterns(patterns):
+    """将模式列表拆分为 (精确名称集合, 扩展名元组, 通配符合并正则)"""
+    exact = frozenset(p for p in patterns if not any(c in p for c in _GLOB_CHARS))
+    exts = tuple(
+        p[1:] for p in patterns
+        if p.startswith("*.") and not any(c in p[2:] for c in _GLOB_CHARS)
+    )
+    globs = [
+        p for p in patterns
+        if p not in exact and not (p.startswith("*.") and p[1:] in exts)
+    ]
+    return exact, exts, compile_globs(globs)
+
+
+def split_skip_patterns(patterns):
+    """按是否包含路径分隔符拆分为 (名称模式, 路径模式)，各自再经 split_patterns 预处理"""
+    name_patterns = [p for p in patterns if "/" not in p and "\\" not in p]
+    path_patterns = [os.path.normpath(p) for p in patterns if "/" in p or "\\" in p]
+    return split_patterns(name_patterns), split_patterns(path_patterns)
+
+
+# 导入时拆分一次：名称模式只匹配名称，含分隔符的模式才匹配完整路径；
+# 精确名称用集合查找，扩展名用 endswith，剩余通配符合并为一个正则
+_FOLDERS_TO_SKIP = split_skip_patterns(FOLDERS_TO_SKIP)
+_FILES_TO_SKIP = split_skip_patterns(FILES_TO_SKIP)
+
 # ==================== 功能函数 ====================
 
 
-def match_pattern(path_str, patterns):
-    """检查路径是否匹配任一模式"""
-    path = Path(path_str)
-    for pattern in patterns:
-        # 支持通配符匹配
-        if fnmatch.fnmatch(path.name, pattern):
-            return True
-        # 支持完整路径匹配
-        if fnmatch.fnmatch(str(path), pattern):
-            return True
-    return False
+def _match_name(name, patterns):
+    """检查单个名称是否匹配拆分后的模式"""
+    exact, exts, globs_re = patterns
+    return (
+        name in exact
+        or name.endswith(exts)
+        or (globs_re is not None and globs_re.match(name) is not None)
+    )
+
+
+def match_pattern(name, path_str, patterns):
+    """检查名称或完整路径是否匹配（patterns 为 split_skip_patterns 的结果）"""
+    name_patterns, path_patterns = patterns
+    return _match_name(name, name_patterns) or _match_name(path_str, path_patterns)
+
+
+def _scan_folder(path, all_paths):
+    """基于 os.scandir 递归收集 (路径, 大小, 是否目录)，跳过 FOLDERS_TO_SKIP 中的子目录"""
+    all_paths.append((path, 0, True))
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                # 过滤掉要跳过的子目录
+                if not match_pattern(entry.name, entry.path, _FOLDERS_TO_SKIP):
+                    _scan_folder(entry.path, all_paths)
+            elif entry.is_file():
+                # 大小直接取自 DirEntry，后续显示和打包不再重复 stat
+                all_paths.append((entry.path, entry.stat().st_size, False))
 
 
 def collect_files_from_folders(folders):
-    """从文件夹列表中收集所有文件和文件夹路径"""
+    """从文件夹列表中收集所有文件和文件夹，返回 (路径, 大小, 是否目录) 列表"""
     all_paths = []
 
     for folder in folders:
@@ -82,43 +176,32 @@ def collect_files_from_folders(folders):
 
         print(f"  扫描文件夹: {folder}/")
 
-        # 添加文件夹本身
-        all_paths.append(folder_path)
-
-        # 遍历文件夹内容
-        for root, dirs, files in os.walk(folder_path):
-            root_path = Path(root)
-
-            # 检查是否需要跳过当前目录
-            if match_pattern(root_path, FOLDERS_TO_SKIP):
-                dirs[:] = []  # 不再深入子目录
-                continue
-
-            # 过滤掉要跳过的子目录
-            dirs[:] = [d for d in dirs if not match_pattern(Path(root) / d, FOLDERS_TO_SKIP)]
-
-            # 添加目录
-            all_paths.append(root_path)
+        # 检查是否需要跳过当前目录（连同文件夹本身一起排除）
+        if match_pattern(folder_path.name, str(folder_path), _FOLDERS_TO_SKIP):
+            continue
 
-            # 添加文件
-            for file in files:
-                file_path = root_path / file
-                all_paths.append(file_path)
+        # 添加文件夹本身并遍历其内容
+        _scan_folder(str(folder_path), all_paths)
 
     return all_paths
 
 
 def collect_files_from_patterns(patterns):
-    """从文件模式列表中收集文件（支持通配符）"""
+    """从文件模式列表中收集文件（支持通配符），返回 (路径, 大小, 是否目录) 列表"""
     all_files = []
 
     for pattern in patterns:
         # 使用 glob 支持通配符
         matched_files = glob.glob(pattern, recursive=True)
         for file_path in matched_files:
-            path = Path(file_path)
-            if path.exists() and path.is_file():
-                all_files.append(path)
+            # 规范化路径（如 ./src/x.py -> src/x.py），与文件夹收集的路径一致，后续按字符串去重
+            file_path = os.path.normpath(file_path)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                all_files.append((file_path, st.st_size, False))
                 print(f"  匹配文件: {file_path}")
 
     return all_files
@@ -128,20 +211,154 @@ def filter_paths(paths, skip_files, skip_folders):
     """过滤掉要跳过的文件和文件夹"""
     filtered_paths = []
 
-    for path in paths:
+    for item in paths:
+        path, _, is_dir = item
+        name = os.path.basename(path)
         # 检查是否是要跳过的文件
-        if path.is_file() and match_pattern(path, skip_files):
+        if not is_dir and match_pattern(name, path, skip_files):
             continue
 
         # 检查是否是要跳过的文件夹
-        if path.is_dir() and match_pattern(path, skip_folders):
+        if is_dir and match_pattern(name, path, skip_folders):
             continue
 
-        filtered_paths.append(path)
+        filtered_paths.append(item)
 
     return filtered_paths
 
 
+def _write_lines(lines, force=False):
+    """批量输出：累计到 OUTPUT_BATCH_LINES 行或 force 时一次性写出"""
+    if lines and (force or len(lines) >= OUTPUT_BATCH_LINES):
+        sys.stdout.write("\n".join(lines) + "\n")
+        lines.clear()
+
+
+def _compress_type(path):
+    """已压缩格式直接存储，其余使用 deflate"""
+    if os.path.splitext(path)[1].lower() in _INCOMPRESSIBLE:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _stream_file(zipf, path):
+    """大文件以 1 MiB 块流式写入（由写入线程调用）"""
+    zinfo = zipfile.ZipInfo.from_file(path, path)
+    zinfo.compress_type = _compress_type(path)
+    zinfo._compresslevel = 1  # ZipFile.open 不接受 compresslevel 参数，只能设在 ZipInfo 上
+    with open(path, "rb") as src, zipf.open(zinfo, "w", force_zip64=True) as dst:
+        shutil.copyfileobj(src, dst, length=_COPY_BUFFER)
+
+
+def _deflate(data):
+    """对整块数据做一次 raw deflate（压缩期间释放 GIL，多个线程可并行压缩）"""
+    compressor = _zlib.compressobj(1, _zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _deflate_file(path, size):
+    """在工作线程中读取并压缩文件，返回填好 CRC 和大小的 (ZipInfo, 数据)"""
+    zinfo = zipfile.ZipInfo.from_file(path, path)
+    zinfo.compress_type = _compress_type(path)
+    deflate = zinfo.compress_type == zipfile.ZIP_DEFLATED
+
+    with open(path, "rb") as f:
+        if deflate and size > _MMAP_THRESHOLD:
+            # 映射到内存直接交给 zlib，省去 read 的一次用户态拷贝
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                zinfo.CRC = _zlib.crc32(mm)
+                zinfo.file_size = len(mm)
+                data = _deflate(mm)
+        else:
+            data = f.read()
+            zinfo.CRC = _zlib.crc32(data)
+            zinfo.file_size = len(data)
+            if deflate:
+                data = _deflate(data)
+
+    zinfo.compress_size = len(data)
+    return zinfo, data
+
+
+def _append_compressed(zipf, zinfo, data):
+    """把预先压缩好的数据直接追加到 zip（与 ZipFile.mkdir 的写入流程一致）"""
+    with zipf._lock:
+        if zipf._seekable:
+            zipf.fp.seek(zipf.start_dir)
+        zinfo.header_offset = zipf.fp.tell()
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.fp.write(zinfo.FileHeader())
+        zipf.fp.write(data)
+        zipf.start_dir = zipf.fp.tell()
+
+
+def _zip_writer(zipf, jobs, lines, step, errors):
+    """写入线程：按提交顺序从队列取出任务写入 zip，收到 None 时结束"""
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        if errors:
+            # 已出错：继续消费剩余任务，避免生产者阻塞在 put 上
+            continue
+
+        index, path, size, is_dir, future = job
+        try:
+            # 显示进度（按间隔抽样，批量输出）
+            if index % step == 0:
+                if not is_dir:
+                    size_kb = size / 1024
+                    lines.append(f"  添加: {path} ({size_kb:.1f} KB)")
+                else:
+                    lines.append(f"  添加: {path}/")
+                _write_lines(lines)
+
+            # 写入 zip
+            if is_dir:
+                zipf.write(path, path)
+            elif future is None:
+                _stream_file(zipf, path)
+            else:
+                _append_compressed(zipf, *future.result())
+        except BaseException as e:
+            errors.append(e)
+
+
+def write_entries(zipf, paths, sizes, is_dirs):
+    """读取+压缩 / 写入流水线
+
+    主线程把小文件提交到线程池读取并压缩，再把任务按顺序放入有界队列；
+    独立的写入线程从队列取出结果追加到 zip（目录和大文件也由它直接写入），
+    写盘与后续文件的压缩相互重叠。队列长度限制了在途数据量。
+    """
+    workers = os.cpu_count() or 1
+    jobs = queue.Queue(maxsize=workers * 2)
+    lines = []
+    errors = []
+    step = max(1, len(paths) // MAX_PROGRESS_LINES)
+
+    writer = threading.Thread(target=_zip_writer, args=(zipf, jobs, lines, step, errors))
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index, (path, size, is_dir) in enumerate(zip(paths, sizes, is_dirs)):
+                future = None
+                if not is_dir and size <= _STREAM_THRESHOLD:
+                    future = executor.submit(_deflate_file, path, size)
+                jobs.put((index, path, size, is_dir, future))
+    finally:
+        jobs.put(None)
+        writer.join()
+
+    _write_lines(lines, force=True)
+    if errors:
+        raise errors[0]
+
+
 def create_backup():
     """创建项目备份"""
 
@@ -174,22 +391,27 @@ def create_backup():
 
     # 第二步：应用排除规则
     print("\n[步骤 2/4] 应用排除规则...")
-    filtered_paths = filter_paths(all_paths, FILES_TO_SKIP, FOLDERS_TO_SKIP)
+    filtered_paths = filter_paths(all_paths, _FILES_TO_SKIP, _FOLDERS_TO_SKIP)
     print(f"  排除后剩余 {len(filtered_paths)} 个路径")
 
-    # 去重并排序
-    filtered_paths = sorted(set(filtered_paths))
+    # 按路径字符串去重并排序，再拆分为路径 / 大小 / 是否目录三个并行数组
+    seen = set()
+    unique = [t for t in filtered_paths if not (t[0] in seen or seen.add(t[0]))]
+    unique.sort(key=lambda t: t[0])
+    paths = [t[0] for t in unique]
+    sizes = [t[1] for t in unique]
+    is_dirs = [t[2] for t in unique]
 
     # 第三步：显示要打包的内容，等待用户确认
     print("\n[步骤 3/4] 要打包的内容:")
     print("-" * 60)
 
     # 分类显示
-    folders = [p for p in filtered_paths if p.is_dir()]
-    files = [p for p in filtered_paths if p.is_file()]
+    folders = [p for p, is_dir in zip(paths, is_dirs) if is_dir]
+    files = [(p, size) for p, size, is_dir in zip(paths, sizes, is_dirs) if not is_dir]
 
     # 计算总大小
-    total_size = sum(f.stat().st_size for f in files)
+    total_size = sum(size for _, size in files)
 
     # 格式化大小显示
     if total_size < 1024:
@@ -201,18 +423,19 @@ def create_backup():
     else:
         size_str = f"{total_size / (1024 * 1024 * 1024):.2f} GB"
 
-    print(f"\n文件夹 ({len(folders)} 个):")
+    lines = [f"\n文件夹 ({len(folders)} 个):"]
     for folder in folders[:500]:  # 最多显示20个
-        print(f"  📁 {folder}")
+        lines.append(f"  📁 {folder}")
     if len(folders) > 500:
-        print(f"  ... 还有 {len(folders) - 500} 个文件夹")
+        lines.append(f"  ... 还有 {len(folders) - 500} 个文件夹")
 
-    print(f"\n文件 ({len(files)} 个):")
-    for file in files[:500]:  # 最多显示20个
-        size_kb = file.stat().st_size / 1024
-        print(f"  📄 {file} ({size_kb:.1f} KB)")
+    lines.append(f"\n文件 ({len(files)} 个):")
+    for file, size in files[:500]:  # 最多显示20个
+        size_kb = size / 1024
+        lines.append(f"  📄 {file} ({size_kb:.1f} KB)")
     if len(files) > 500:
-        print(f"  ... 还有 {len(files) - 500} 个文件")
+        lines.append(f"  ... 还有 {len(files) - 500} 个文件")
+    _write_lines(lines, force=True)
 
     print("-" * 60)
     print(f"总计: {len(folders)} 个文件夹, {len(files)} 个文件, 总大小: {size_str}")
@@ -248,17 +471,8 @@ def create_backup():
     # 创建 zip 文件
     print(f"正在创建备份: {backup_name}")
 
-    with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for path in filtered_paths:
-            # 显示进度
-            if path.is_file():
-                size_kb = path.stat().st_size / 1024
-                print(f"  添加: {path} ({size_kb:.1f} KB)")
-            else:
-                print(f"  添加: {path}/")
-
-            # 写入 zip
-            zipf.write(path, path)
+    with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+        write_entries(zipf, paths, sizes, is_dirs)
 
     # 获取文件大小
     size_mb = backup_path.stat().st_size / (1024 * 1024)
@@ -6,8 +6,10 @@
 
 import os
 import sys
+import stat
 import platform
 import shutil
+import functools
 import subprocess
 from pathlib import Path
 
@@ -169,13 +171,7 @@ def create_symlink(external_dir: Path):
         try:
             # 检查是否是 junction（Windows 特有）
             if SYSTEM == "Windows" and local_claude.is_dir() and not local_claude.is_symlink():
-                # 使用 fsutil 检查是否是 reparse point (junction)
-                result = subprocess.run(
-                    ['fsutil', 'reparsepoint', 'query', str(local_claude)],
-                    capture_output=True,
-                    text=True
-                )
-                if result.returncode != 0:
+                if not is_junction(local_claude):
                     # 不是 junction，是普通目录
                     shutil.move(local_claude, backup_claude)
                     print(f"备份现有目录: {local_claude} -> {backup_claude}")
@@ -215,20 +211,32 @@ def create_symlink(external_dir: Path):
 
     # 创建符号链接
     if SYSTEM == "Windows":
-        return create_symlink_windows(external_dir, local_claude)
+        created = create_symlink_windows(external_dir, local_claude)
     else:
         os.symlink(external_dir, local_claude)
         print(f"创建符号链接: {local_claude} -> {external_dir}")
-        return True
+        created = True
 
+    # 链接状态已改变，清除 junction 检查缓存
+    is_junction.cache_clear()
+    return created
 
-def is_junction(path: Path) -> bool:
-    """检查路径是否是 Windows junction"""
-    if SYSTEM != "Windows" or not path.exists():
+
+@functools.lru_cache(maxsize=32)
+def _is_junction(path_str: str) -> bool:
+    """is_junction 的缓存实现，以路径字符串为键"""
+    if SYSTEM != "Windows" or not os.path.exists(path_str):
         return False
+    # 先检查 reparse point 属性位，普通目录无需启动 fsutil 子进程
+    try:
+        attributes = os.lstat(path_str).st_file_attributes
+        if not attributes & stat.FILE_ATTRIBUTE_REPARSE_POINT:
+            return False
+    except (OSError, AttributeError):
+        pass
     try:
         result = subprocess.run(
-            ['fsutil', 'reparsepoint', 'query', str(path)],
+            ['fsutil', 'reparsepoint', 'query', path_str],
             capture_output=True,
             text=True
         )
@@ -237,6 +245,14 @@ def is_junction(path: Path) -> bool:
         return False
 
 
+def is_junction(path: Path) -> bool:
+    """检查路径是否是 Windows junction（按路径缓存结果）"""
+    return _is_junction(str(path))
+
+
+is_junction.cache_clear = _is_junction.cache_clear
+
+
 def remove_symlink():
     """移除符号链接或 junction 并恢复原目录"""
     project_dir = Path.cwd()
@@ -264,6 +280,9 @@ def remove_symlink():
         shutil.move(backup_claude, local_claude)
         print(f"恢复备份目录: {backup_claude} -> {local_claude}")
 
+    # 链接状态已改变，清除 junction 检查缓存
+    is_junction.cache_clear()
+
 
 def show_status():
     """显示当前状态"""
@@ -2,22 +2,26 @@
 """跨平台持久终端会话管理器"""
 
 # === 依赖加载 ===
+import os
 import sys
-from pathlib import Path
 
-_p = Path(__file__).resolve().parent
-while _p != _p.parent:
-    if _p.name == "skills" and (_p / ".scripts" / "lib" / "libloader.py").exists():
-        sys.path.insert(0, str(_p / ".scripts" / "lib"))
+_p = os.path.dirname(os.path.abspath(__file__))
+while _p != os.path.dirname(_p):
+    _lib = os.path.join(_p, ".scripts", "lib")
+    if os.path.basename(_p) == "skills" and os.path.isfile(os.path.join(_lib, "libloader.py")):
+        sys.path.insert(0, _lib)
         from libloader import setup
         setup()
         break
-    _p = _p.parent
+    _p = os.path.dirname(_p)
 # === 依赖加载结束 ===
 
+from contextlib import contextmanager
+from pathlib import Path
 import argparse
 import json
 import platform
+import shutil
 import time
 import logging
 
@@ -25,12 +29,20 @@ SCRIPT_DIR = Path(__file__).parent
 SKILL_DIR = SCRIPT_DIR.parent
 
 
+_claude_dir: Path | None = None
+
+
 def _find_claude_dir() -> Path:
-    d = Path(__file__).resolve().parent
-    while d != d.parent:
-        if (d / ".claude").is_dir():
-            return d / ".claude"
-        d = d.parent
+    global _claude_dir
+    if _claude_dir is not None:
+        return _claude_dir
+    d = os.path.dirname(os.path.abspath(__file__))
+    while d != os.path.dirname(d):
+        candidate = os.path.join(d, ".claude")
+        if os.path.isdir(candidate):
+            _claude_dir = Path(candidate)
+            return _claude_dir
+        d = os.path.dirname(d)
     raise FileNotFoundError("找不到 .claude 目录")
 
 
@@ -57,26 +69,200 @@ SESSION_DIR.mkdir(parents=True, exist_ok=True)
 
 IS_WINDOWS = platform.system() == "Windows"
 
+# exec 单次最多保留的输出字节数，超出部分只保留末尾
+MAX_EXEC_OUTPUT = 1024 * 1024
+
+INDEX_FILE = SESSION_DIR / "_index.json"
+
+def _encode(name: str) -> str:
+    """会话名转为安全的文件名：哈希前缀保证唯一，后缀保留可读的名称片段"""
+    import hashlib, re
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+    return digest + "_" + re.sub(r"[^A-Za-z0-9_-]", "-", name)[:32]
+
+
 def _get_session_file(name: str) -> Path:
-    return SESSION_DIR / f"{name}.json"
+    return SESSION_DIR / f"{_encode(name)}.json"
+
+
+def _get_session_dir(name: str) -> Path:
+    return SESSION_DIR / _encode(name)
+
+
+def _session_files():
+    """遍历各会话的信息文件（不含索引文件）"""
+    return (f for f in SESSION_DIR.glob("*.json") if f != INDEX_FILE)
+
+
+LOCK_TIMEOUT = 10
+
+
+@contextmanager
+def _locked(path: Path, exclusive: bool = True, timeout: float = LOCK_TIMEOUT, remove: bool = False):
+    """对 <path>.lock 加文件锁，并发的 Bash 调用之间串行化读写；remove 为真时释放前删除锁文件"""
+    lock_path = path.with_name(path.name + ".lock")
+    fd = os.open(str(lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    try:
+        if IS_WINDOWS:
+            import msvcrt
+            # msvcrt 只有排他锁，共享锁同样按排他处理
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"等待文件锁超时: {lock_path}")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+                if remove:
+                    # Windows 上无法删除仍打开的文件，关闭后再尽力删除
+                    os.close(fd)
+                    fd = None
+                    try:
+                        os.unlink(lock_path)
+                    except OSError:
+                        pass
+        else:
+            import fcntl
+            mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            while True:
+                try:
+                    fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"等待文件锁超时: {lock_path}")
+                    time.sleep(0.05)
+                    continue
+                # 等待期间锁文件可能已被删除（并被重建），锁住的是旧文件时重新打开再加锁
+                try:
+                    if os.path.samestat(os.fstat(fd), os.stat(lock_path)):
+                        break
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+                fd = os.open(str(lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                yield
+            finally:
+                if remove:
+                    # 持锁时删除，之后拿到旧文件锁的进程会按上面的检查重新加锁
+                    lock_path.unlink(missing_ok=True)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def _write_json_atomic(path: Path, data):
+    """先写临时文件再 os.replace，读者永远看不到写了一半的 JSON"""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path):
+    """加共享锁读取 JSON 文件，文件不存在时返回 None"""
+    # 文件不存在时直接返回，不为不存在的会话留下锁文件
+    if not path.exists():
+        return None
+    with _locked(path, exclusive=False):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+
+def _update_index(name: str, info: dict | None):
+    """在锁内更新会话索引，info 为 None 时删除该条目"""
+    with _locked(INDEX_FILE):
+        try:
+            index = json.loads(INDEX_FILE.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            # 索引缺失或损坏时从各会话文件重建
+            index = {}
+            for f in _session_files():
+                try:
+                    entry = json.loads(f.read_text(encoding="utf-8"))
+                    index[entry.get("name", f.stem)] = entry
+                except (OSError, ValueError):
+                    pass
+        if info is None:
+            index.pop(name, None)
+        else:
+            index[name] = info
+        _write_json_atomic(INDEX_FILE, index)
+
+
+def _load_index() -> dict:
+    """读取会话索引；索引缺失时以各会话文件为准"""
+    index = _read_json(INDEX_FILE)
+    if index is not None:
+        return index
+    index = {}
+    for f in _session_files():
+        info = _read_json(f)
+        if info is not None:
+            index[info.get("name", f.stem)] = info
+    return index
 
 
 def _save_session_info(name: str, pid: int, shell: str):
     info = {"name": name, "pid": pid, "shell": shell, "created_at": time.time()}
-    _get_session_file(name).write_text(json.dumps(info), encoding="utf-8")
+    f = _get_session_file(name)
+    with _locked(f):
+        _write_json_atomic(f, info)
+    _update_index(name, info)
 
 
 def _load_session_info(name: str) -> dict | None:
-    f = _get_session_file(name)
-    if f.exists():
-        return json.loads(f.read_text(encoding="utf-8"))
-    return None
+    return _read_json(_get_session_file(name))
 
 
 def _remove_session_info(name: str):
     f = _get_session_file(name)
-    if f.exists():
-        f.unlink()
+    with _locked(f, remove=True):
+        f.unlink(missing_ok=True)
+    _update_index(name, None)
+
+
+def _truncate(output: str, max_chars: int) -> str:
+    """保留末尾 max_chars 个字符，并从下一个行首开始，避免出现半行"""
+    if max_chars <= 0 or len(output) <= max_chars:
+        return output
+    start = len(output) - max_chars
+    nl = output.find("\n", start)
+    if nl >= 0:
+        start = nl + 1
+    return output[start:] + "\n... (输出已截断)"
+
+
+def _strip_sentinels(text: str) -> str:
+    """去掉 exec 写入的完成标记。命令输出不以换行结尾时标记会接在同一行末尾，
+    因此不限定在行首匹配"""
+    import re
+    return re.sub(r"__DONE_[0-9a-f]{16}__\n?", "", text)
+
+
+def _tail(path: Path, n: int) -> list[str]:
+    """从文件末尾向前按块读取，返回最后 n 行（不含 exec 完成标记行）"""
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        chunk = max(n * 256, 4096)
+        while True:
+            start = max(0, size - chunk) if n > 0 else 0
+            f.seek(start)
+            data = f.read(size - start)
+            lines = _strip_sentinels(data.decode("utf-8", errors="replace")).split("\n")
+            # 非文件开头时首行可能不完整，需多读出一行
+            if start == 0 or len(lines) > n:
+                return lines[-n:]
+            chunk *= 2
 
 
 def _result(success: bool, **kwargs) -> str:
@@ -84,11 +270,38 @@ def _result(success: bool, **kwargs) -> str:
     return json.dumps(data, ensure_ascii=False, indent=2)
 
 
+# 进程启动时查找一次 tmux，避免每次调用都遍历 PATH
+_TMUX_PATH = shutil.which("tmux")
+# 所有 tmux 调用的 argv[0]，使用绝对路径，execvp 无需再搜索 PATH
+_TMUX_BIN = _TMUX_PATH or "tmux"
+# _check_tmux 的结果（成功或失败）在进程内只计算一次，None 表示尚未检查
+_TMUX_STATUS: bool | None = None
+
+
 def _check_tmux() -> bool:
-    """检查 tmux 是否可用，不可用时自动安装"""
-    import subprocess, shutil
+    """检查 tmux 是否可用，不可用时自动安装（结果在进程内缓存）"""
+    global _TMUX_STATUS
+    if _TMUX_STATUS is None:
+        _TMUX_STATUS = _detect_tmux()
+    return _TMUX_STATUS
+
+
+def _reset_tmux_check():
+    """清除缓存的 tmux 检查结果，下次调用重新检测"""
+    global _TMUX_PATH, _TMUX_BIN, _TMUX_STATUS
+    _TMUX_PATH = shutil.which("tmux")
+    _TMUX_BIN = _TMUX_PATH or "tmux"
+    _TMUX_STATUS = None
+
+
+_check_tmux.reset = _reset_tmux_check
 
-    if shutil.which("tmux"):
+
+def _detect_tmux() -> bool:
+    import subprocess
+    global _TMUX_PATH, _TMUX_BIN
+
+    if _TMUX_PATH:
         return True
 
     if IS_WINDOWS:
@@ -106,7 +319,10 @@ def _check_tmux() -> bool:
             continue
         try:
             r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            if r.returncode == 0 and shutil.which("tmux"):
+            if r.returncode == 0:
+                _TMUX_PATH = shutil.which("tmux")
+                _TMUX_BIN = _TMUX_PATH or "tmux"
+            if _TMUX_PATH:
                 logger.info(f"tmux 通过 {name} 安装成功")
                 return True
             logger.warning(f"{name} 安装失败: {r.stderr.strip()}")
@@ -115,6 +331,30 @@ def _check_tmux() -> bool:
     return False
 
 
+def _tmux(*args, **kwargs):
+    """执行一条 tmux 子命令，默认捕获文本输出"""
+    import subprocess
+    kwargs.setdefault("capture_output", True)
+    kwargs.setdefault("text", True)
+    try:
+        return subprocess.run([_TMUX_BIN, *args], **kwargs)
+    except FileNotFoundError:
+        # tmux 被移除，下次重新检测
+        _check_tmux.reset()
+        raise
+
+
+def _tmux_session_missing(r) -> bool:
+    """根据 tmux 命令的返回结果判断会话（或 tmux 服务）是否不存在"""
+    if r.returncode == 0:
+        return False
+    stderr = r.stderr or ""
+    return any(msg in stderr for msg in (
+        "can't find session", "can't find pane", "can't find window",
+        "session not found", "no server running", "error connecting to",
+    ))
+
+
 # === tmux 后端（macOS/Linux 首选） ===
 
 class TmuxBackend:
@@ -122,22 +362,18 @@ class TmuxBackend:
 
     @staticmethod
     def create(name: str, shell: str | None = None) -> str:
-        import subprocess
         if not _check_tmux():
             return _result(False, error="tmux 自动安装失败，请手动安装: brew install tmux (macOS) 或 apt install tmux (Linux)")
 
         # 检查会话是否已存在
-        r = subprocess.run(["tmux", "has-session", "-t", name], capture_output=True)
+        r = _tmux("has-session", "-t", name)
         if r.returncode == 0:
             return _result(False, error=f"会话 '{name}' 已存在")
 
         shell_cmd = shell or "/bin/bash"
-        subprocess.run(
-            ["tmux", "new-session", "-d", "-s", name, "-x", "200", "-y", "50", shell_cmd],
-            capture_output=True, check=True,
-        )
+        _tmux("new-session", "-d", "-s", name, "-x", "200", "-y", "50", shell_cmd, check=True)
         # 获取 tmux server pid
-        r2 = subprocess.run(["tmux", "display-message", "-t", name, "-p", "#{pid}"], capture_output=True, text=True)
+        r2 = _tmux("display-message", "-t", name, "-p", "#{pid}")
         pid = int(r2.stdout.strip()) if r2.stdout.strip().isdigit() else 0
         _save_session_info(name, pid, shell_cmd)
         logger.info(f"创建会话: {name}, shell={shell_cmd}")
@@ -145,106 +381,117 @@ class TmuxBackend:
 
     @staticmethod
     def exec_cmd(name: str, cmd: str, timeout: int = 10) -> str:
-        import subprocess
+        import shlex, subprocess
+
+        # 用唯一标记包裹命令，方便提取输出；标记同时作为 tmux wait-for 的通道名
+        marker = f"__CMD_{os.urandom(8).hex()}__"
+        # 标记拆成两段引号，回显的命令行里不会出现完整标记，只有 echo 的输出会匹配
+        start_marker = f"echo '{marker}''_START'"
+        end_marker = f"echo '{marker}''_END'; {shlex.quote(_TMUX_BIN)} wait-for -S {marker}"
+
+        # 先开始等待再发送命令，命令结束时由会话内的 shell 发出信号，无需轮询
+        waiter = subprocess.Popen(
+            [_TMUX_BIN, "wait-for", marker],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
 
-        # 检查会话是否存在
-        r = subprocess.run(["tmux", "has-session", "-t", name], capture_output=True)
+        # 一次 send-keys 发送三行，tmux 按顺序投递按键，无需中间等待；
+        # 同一次调用里先记下发送前的历史行数和光标行，完成后只抓取此后的区域。
+        # 不单独检查会话是否存在，发送失败即说明会话不存在
+        r = _tmux(
+            "display-message", "-t", name, "-p", "#{history_size} #{cursor_y}", ";",
+            "send-keys", "-t", name, start_marker, "Enter", cmd, "Enter", end_marker, "Enter",
+        )
         if r.returncode != 0:
-            return _result(False, error=f"会话 '{name}' 不存在")
+            waiter.kill()
+            waiter.wait()
+            if _tmux_session_missing(r):
+                return _result(False, error=f"会话 '{name}' 不存在")
+            return _result(False, error=f"发送命令失败: {r.stderr.strip()}")
 
-        # 用唯一标记包裹命令，方便提取输出
-        marker = f"__CMD_{int(time.time() * 1000)}__"
-        start_marker = f"echo '{marker}_START'"
-        end_marker = f"echo '{marker}_END'"
-
-        # 发送命令
-        subprocess.run(["tmux", "send-keys", "-t", name, start_marker, "Enter"], capture_output=True)
-        time.sleep(0.1)
-        subprocess.run(["tmux", "send-keys", "-t", name, cmd, "Enter"], capture_output=True)
-        subprocess.run(["tmux", "send-keys", "-t", name, end_marker, "Enter"], capture_output=True)
-
-        # 等待输出完成
-        output = ""
-        for _ in range(timeout * 10):
-            time.sleep(0.1)
-            r = subprocess.run(
-                ["tmux", "capture-pane", "-t", name, "-p", "-S", "-1000"],
-                capture_output=True, text=True,
-            )
-            captured = r.stdout
-            if f"{marker}_END" in captured:
-                # 提取 START 和 END 之间的内容
-                lines = captured.split("\n")
-                collecting = False
-                result_lines = []
-                for line in lines:
-                    if f"{marker}_START" in line:
-                        collecting = True
-                        continue
-                    if f"{marker}_END" in line:
-                        collecting = False
-                        continue
-                    if collecting:
-                        result_lines.append(line)
-                # 去掉第一行（命令本身的回显）和最后的空行
-                if result_lines and cmd.strip() in result_lines[0]:
-                    result_lines = result_lines[1:]
-                output = "\n".join(result_lines).rstrip()
-                break
-        else:
+        # 等待命令完成
+        try:
+            waiter.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            waiter.kill()
+            waiter.wait()
             # 超时，只返回简短提示，不返回历史内容
             return _result(True, session=name, output="", warning="命令执行超时，请稍后用 read 查看输出")
 
+        # 完成后只抓取发送命令之后新增的区域；历史被截断（达到 history-limit）时退回固定范围
+        start = "-1000"
+        before = r.stdout
+        r = _tmux("display-message", "-t", name, "-p", "#{history_size} #{history_limit}")
+        if _tmux_session_missing(r):
+            return _result(False, error=f"会话 '{name}' 不存在")
+        if r.returncode == 0:
+            try:
+                h0, cy0 = (int(x) for x in before.split())
+                h1, limit = (int(x) for x in r.stdout.split())
+                if h1 < limit:
+                    start = str(h0 + cy0 - h1)
+            except ValueError:
+                pass
+        r = _tmux("capture-pane", "-t", name, "-p", "-J", "-S", start, "-E", "-")
+        if _tmux_session_missing(r):
+            return _result(False, error=f"会话 '{name}' 不存在")
+        # 定位 START 和 END 标记的输出行，一次切片取出中间内容
+        text = r.stdout
+        i = text.find(f"{marker}_START")
+        j = text.find(f"{marker}_END", i) if i >= 0 else -1
+        output = ""
+        if j >= 0:
+            body_start = text.find("\n", i) + 1
+            # 结束标记命令的回显行也在其中，从它所在行的行首截断
+            k = text.rfind(marker, body_start, j)
+            body_end = text.rfind("\n", body_start, k if k >= 0 else j)
+            body = text[body_start:body_end] if body_end >= 0 else ""
+            # 去掉第一行（命令本身的回显）和最后的空行
+            first, _, rest = body.partition("\n")
+            if cmd.strip() in first:
+                body = rest
+            output = body.rstrip()
+
         logger.info(f"执行命令: session={name}, cmd={cmd}")
         return _result(True, session=name, output=output)
 
     @staticmethod
     def send(name: str, text: str) -> str:
         """纯文本发送，不加标记，适用于密码等交互式输入"""
-        import subprocess
-        r = subprocess.run(["tmux", "has-session", "-t", name], capture_output=True)
-        if r.returncode != 0:
+        r = _tmux("send-keys", "-t", name, "-l", text)
+        if _tmux_session_missing(r):
             return _result(False, error=f"会话 '{name}' 不存在")
-        subprocess.run(["tmux", "send-keys", "-t", name, "-l", text], capture_output=True)
-        subprocess.run(["tmux", "send-keys", "-t", name, "Enter"], capture_output=True)
+        if r.returncode != 0:
+            return _result(False, error=f"发送失败: {r.stderr.strip()}")
+        _tmux("send-keys", "-t", name, "Enter")
         logger.info(f"发送文本: session={name}, len={len(text)}")
         return _result(True, session=name, message="文本已发送")
 
     @staticmethod
     def read(name: str, lines: int = 30, max_chars: int = 2000, output_file: str = "") -> str:
-        import subprocess
-        r = subprocess.run(["tmux", "has-session", "-t", name], capture_output=True)
-        if r.returncode != 0:
+        r = _tmux("capture-pane", "-t", name, "-p", "-S", f"-{lines}")
+        if _tmux_session_missing(r):
             return _result(False, error=f"会话 '{name}' 不存在")
-
-        r = subprocess.run(
-            ["tmux", "capture-pane", "-t", name, "-p", "-S", f"-{lines}"],
-            capture_output=True, text=True,
-        )
-        output = r.stdout.rstrip()
+        if r.returncode != 0:
+            return _result(False, error=f"读取失败: {r.stderr.strip()}")
         # 截断过长输出
-        if max_chars > 0 and len(output) > max_chars:
-            output = output[-max_chars:] + "\n... (输出已截断)"
+        output = _truncate(r.stdout.rstrip(), max_chars)
 
         # 如果指定了输出文件，写入文件并返回简短结果
         if output_file:
             out_path = Path(output_file)
             out_path.parent.mkdir(parents=True, exist_ok=True)
             out_path.write_text(output, encoding="utf-8")
-            return _result(True, session=name, output_file=output_file, lines_count=len(output.split("\n")))
+            return _result(True, session=name, output_file=output_file, lines_count=output.count("\n") + (1 if output else 0))
 
         return _result(True, session=name, output=output)
 
     @staticmethod
     def list_sessions() -> str:
-        import subprocess
         if not _check_tmux():
             return _result(True, sessions=[])
 
-        r = subprocess.run(
-            ["tmux", "list-sessions", "-F", "#{session_name}|#{session_created}|#{session_attached}"],
-            capture_output=True, text=True,
-        )
+        r = _tmux("list-sessions", "-F", "#{session_name}|#{session_created}|#{session_attached}")
         if r.returncode != 0:
             return _result(True, sessions=[])
 
@@ -262,8 +509,7 @@ class TmuxBackend:
 
     @staticmethod
     def close(name: str) -> str:
-        import subprocess
-        r = subprocess.run(["tmux", "kill-session", "-t", name], capture_output=True, text=True)
+        r = _tmux("kill-session", "-t", name)
         _remove_session_info(name)
         if r.returncode == 0:
             logger.info(f"关闭会话: {name}")
@@ -272,11 +518,10 @@ class TmuxBackend:
 
     @staticmethod
     def close_all() -> str:
-        import subprocess
-        subprocess.run(["tmux", "kill-server"], capture_output=True)
-        # 清理所有会话文件
-        for f in SESSION_DIR.glob("*.json"):
-            f.unlink()
+        _tmux("kill-server")
+        # 清理所有会话文件（含锁文件）
+        for f in SESSION_DIR.glob("*.json*"):
+            f.unlink(missing_ok=True)
         logger.info("关闭所有会话")
         return _result(True, message="所有会话已关闭")
 
@@ -285,12 +530,73 @@ class TmuxBackend:
 # === subprocess 后端（纯标准库，跨平台回退） ===
 # 使用 FIFO 命名管道（Unix）或独立进程执行（Windows）实现持久化
 
+_DAEMON_BOOTSTRAP = (
+    f"import sys; sys.path.insert(0, {str(SCRIPT_DIR)!r}); "
+    "from session_daemon import main; main(sys.argv[1:])"
+)
+
+
+def _fifo_send(fifo_path: Path, data: bytes):
+    """直接用 os.write 写入 FIFO，不经过文本编码层和缓冲。
+    以非阻塞方式打开：守护进程已退出（无读端）时立即报错而不是永久阻塞"""
+    fd = os.open(str(fifo_path), os.O_WRONLY | os.O_NONBLOCK)
+    try:
+        os.set_blocking(fd, True)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _inheritable_fds() -> list[int] | None:
+    """列出当前进程中可被子进程继承的描述符；无法枚举时返回 None"""
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            fds = [int(x) for x in os.listdir(fd_dir)]
+        except (OSError, ValueError):
+            continue
+        result = []
+        for fd in fds:
+            try:
+                if os.get_inheritable(fd):
+                    result.append(fd)
+            except OSError:
+                # listdir 自身用过的目录描述符此时已关闭
+                pass
+        return result
+    return None
+
+
+def _spawn_daemon(argv: list[str], pass_fds: tuple = ()) -> int:
+    """在新会话中后台启动守护进程，标准输入输出重定向到 /dev/null，返回 PID。
+    优先用 os.posix_spawn（macOS 上比 fork+exec 快得多），不可用时回退到 Popen。
+    pass_fds 中的描述符需已设为可继承"""
+    inherited = _inheritable_fds() if hasattr(os, "posix_spawn") else None
+    if inherited is not None:
+        import signal
+        actions = [(os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_RDWR, 0) for fd in (0, 1, 2)]
+        # 与 Popen(close_fds=True) 一致：除 pass_fds 外不把调用方的描述符带进长期运行的守护进程，
+        # 否则例如 $(...) 的管道会一直被它持有
+        actions += [(os.POSIX_SPAWN_CLOSE, fd) for fd in inherited if fd > 2 and fd not in pass_fds]
+        # 与 Popen 一致：恢复 Python 忽略掉的信号
+        sigdef = [getattr(signal, n) for n in ("SIGPIPE", "SIGXFZ", "SIGXFSZ") if hasattr(signal, n)]
+        try:
+            return os.posix_spawn(argv[0], argv, os.environ, file_actions=actions, setsid=True, setsigdef=sigdef)
+        except (OSError, NotImplementedError):
+            pass
+    import subprocess as sp
+    return sp.Popen(
+        argv, start_new_session=True, close_fds=True, pass_fds=pass_fds,
+        stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.DEVNULL,
+    ).pid
+
+
 class SubprocessBackend:
     """使用 subprocess + FIFO 命名管道实现持久终端"""
 
     @staticmethod
     def create(name: str, shell: str | None = None) -> str:
-        import subprocess as sp
         import os
 
         info = _load_session_info(name)
@@ -301,7 +607,7 @@ class SubprocessBackend:
             except (OSError, ProcessLookupError):
                 _remove_session_info(name)
 
-        pipe_dir = SESSION_DIR / name
+        pipe_dir = _get_session_dir(name)
         pipe_dir.mkdir(parents=True, exist_ok=True)
         output_file = pipe_dir / "output.log"
         output_file.write_text("", encoding="utf-8")
@@ -323,59 +629,26 @@ class SubprocessBackend:
 
         os.mkfifo(str(fifo_path))
 
-        # 启动守护脚本：从 FIFO 读取命令，通过 shell 执行，输出写入 log
-        daemon_script = f"""
-import os, subprocess, sys, time
-fifo = "{fifo_path}"
-output = "{output_file}"
-shell = "{shell_cmd}"
-pid_file = "{pipe_dir / 'daemon.pid'}"
-
-# 写入守护进程 PID
-with open(pid_file, 'w') as f:
-    f.write(str(os.getpid()))
-
-# 启动 shell 进程
-with open(output, 'a') as out_f:
-    proc = subprocess.Popen(
-        [shell],
-        stdin=subprocess.PIPE,
-        stdout=out_f,
-        stderr=subprocess.STDOUT,
-        start_new_session=True,
-    )
-    # 持续从 FIFO 读取命令并写入 shell stdin
-    while True:
+        # 启动守护进程：以模块方式导入 session_daemon，可复用 .pyc 缓存，
+        # 路径等参数走 argv，不拼接进源码
+        # 守护进程就绪后通过管道回写自己的 PID，父进程读到即返回，无需固定等待
+        ready_r, ready_w = os.pipe()
+        os.set_inheritable(ready_w, True)
         try:
-            with open(fifo, 'r') as fifo_f:
-                for line in fifo_f:
-                    if line.strip() == '__EXIT_SESSION__':
-                        proc.stdin.close()
-                        proc.wait()
-                        sys.exit(0)
-                    try:
-                        proc.stdin.write(line.encode())
-                        proc.stdin.flush()
-                    except (BrokenPipeError, OSError):
-                        sys.exit(1)
-        except (OSError, IOError):
-            time.sleep(0.1)
-"""
-        # 启动守护进程
-        daemon_proc = sp.Popen(
-            [sys.executable, "-c", daemon_script],
-            start_new_session=True,
-            stdout=sp.DEVNULL,
-            stderr=sp.DEVNULL,
-        )
-
-        # 等待守护进程写入 PID 文件
-        time.sleep(0.5)
-        pid_file = pipe_dir / "daemon.pid"
-        if pid_file.exists():
-            daemon_pid = int(pid_file.read_text().strip())
-        else:
-            daemon_pid = daemon_proc.pid
+            daemon_pid = _spawn_daemon(
+                [sys.executable, "-c", _DAEMON_BOOTSTRAP, str(fifo_path), str(output_file), shell_cmd, str(ready_w)],
+                pass_fds=(ready_w,),
+            )
+        finally:
+            os.close(ready_w)
+        try:
+            import select
+            if select.select([ready_r], [], [], 2)[0]:
+                data = os.read(ready_r, 32).strip()
+                if data:
+                    daemon_pid = int(data)
+        finally:
+            os.close(ready_r)
 
         _save_session_info(name, daemon_pid, shell_cmd)
         logger.info(f"创建会话(fifo): {name}, PID={daemon_pid}")
@@ -389,7 +662,7 @@ with open(output, 'a') as out_f:
         if not info:
             return _result(False, error=f"会话 '{name}' 不存在")
 
-        pipe_dir = SESSION_DIR / name
+        pipe_dir = _get_session_dir(name)
         output_file = pipe_dir / "output.log"
         fifo_path = pipe_dir / "stdin.fifo"
 
@@ -410,78 +683,92 @@ with open(output, 'a') as out_f:
         if IS_WINDOWS or not fifo_path.exists():
             return _exec_via_new_process(name, cmd, timeout, output_file, before_size)
 
-        # 通过 FIFO 发送命令
+        # 通过 FIFO 发送命令，随后让 shell 输出完成标记
+        done = f"__DONE_{os.urandom(8).hex()}__".encode()
         try:
-            with open(fifo_path, "w") as f:
-                f.write(cmd + "\n")
+            _fifo_send(fifo_path, cmd.encode() + b"\necho " + done + b"\n")
         except (OSError, IOError) as e:
             return _exec_via_new_process(name, cmd, timeout, output_file, before_size)
 
-        # 等待输出
-        for _ in range(timeout * 10):
-            time.sleep(0.1)
-            current_size = output_file.stat().st_size
-            if current_size > before_size:
-                time.sleep(0.3)
-                # 再检查一次，确保输出稳定
-                final_size = output_file.stat().st_size
-                if final_size == current_size:
+        # 等待完成标记出现在输出中，期间只增量读取新写入的部分。
+        # 之前超时的 exec 留下的旧标记随机串不同，不会被误认为本次的标记
+        buf = bytearray()
+        end = -1
+        dropped = 0
+        deadline = time.monotonic() + timeout
+        with open(output_file, "rb") as f, _watch_file(output_file) as wait:
+            f.seek(before_size)
+            while True:
+                scanned = max(0, len(buf) - len(done))
+                buf += f.read()
+                end = buf.find(done, scanned)
+                if end >= 0:
                     break
+                # 输出过大时丢弃前部，内存占用不随输出量增长
+                if len(buf) > MAX_EXEC_OUTPUT:
+                    dropped += len(buf) - MAX_EXEC_OUTPUT
+                    del buf[:len(buf) - MAX_EXEC_OUTPUT]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait(remaining)
 
-        new_output = output_file.read_text(encoding="utf-8")[before_size:].rstrip()
         logger.info(f"执行命令: session={name}, cmd={cmd}")
-        return _result(True, session=name, output=new_output)
+        extra = {}
+        if end >= 0:
+            del buf[end:]
+            if len(buf) > MAX_EXEC_OUTPUT:
+                dropped += len(buf) - MAX_EXEC_OUTPUT
+                del buf[:len(buf) - MAX_EXEC_OUTPUT]
+        else:
+            extra["warning"] = "命令执行超时，请稍后用 read 查看输出"
+        if dropped:
+            extra["note"] = f"输出过长，已省略前 {dropped} 字节"
+        # 去掉之前超时的 exec 迟到的完成标记行
+        new_output = _strip_sentinels(buf.decode("utf-8", errors="replace")).rstrip()
+        return _result(True, session=name, output=new_output, **extra)
 
     @staticmethod
     def send(name: str, text: str) -> str:
         """纯文本发送，通过 FIFO 写入，适用于密码等交互式输入"""
-        pipe_dir = SESSION_DIR / name
+        pipe_dir = _get_session_dir(name)
         fifo_path = pipe_dir / "stdin.fifo"
         if not fifo_path.exists():
             return _result(False, error=f"会话 '{name}' 不存在或无 FIFO")
         try:
-            with open(fifo_path, "w") as f:
-                f.write(text + "\n")
+            _fifo_send(fifo_path, text.encode() + b"\n")
             logger.info(f"发送文本: session={name}, len={len(text)}")
             return _result(True, session=name, message="文本已发送")
         except (OSError, IOError) as e:
             return _result(False, error=str(e))
 
     @staticmethod
-    def read(name: str, lines: int = 50, output_file: str = "") -> str:
-        pipe_dir = SESSION_DIR / name
+    def read(name: str, lines: int = 50, max_chars: int = 2000, output_file: str = "") -> str:
+        pipe_dir = _get_session_dir(name)
         log_file = pipe_dir / "output.log"
-        if not log_file.exists():
+        try:
+            # 只读取日志末尾，不随日志增长而变慢
+            last_lines = _tail(log_file, lines)
+        except FileNotFoundError:
             return _result(False, error=f"会话 '{name}' 不存在")
-
-        content = log_file.read_text(encoding="utf-8")
-        last_lines = "\n".join(content.split("\n")[-lines:])
-        output = last_lines.rstrip()
+        output = _truncate("\n".join(last_lines).rstrip(), max_chars)
 
         # 如果指定了输出文件，写入文件并返回简短结果
         if output_file:
             out_path = Path(output_file)
             out_path.parent.mkdir(parents=True, exist_ok=True)
             out_path.write_text(output, encoding="utf-8")
-            return _result(True, session=name, output_file=output_file, lines_count=len(output.split("\n")))
+            return _result(True, session=name, output_file=output_file, lines_count=output.count("\n") + (1 if output else 0))
 
         return _result(True, session=name, output=output)
 
     @staticmethod
     def list_sessions() -> str:
-        import os
-        sessions = []
-        for f in SESSION_DIR.glob("*.json"):
-            info = json.loads(f.read_text(encoding="utf-8"))
-            alive = False
-            if info.get("pid", 0) > 0:
-                try:
-                    os.kill(info["pid"], 0)
-                    alive = True
-                except (OSError, ProcessLookupError):
-                    pass
-            info["alive"] = alive
-            sessions.append(info)
+        # 只读一次索引文件，不再逐个解析会话文件
+        sessions = list(_load_index().values())
+        alive = _alive_pids([info.get("pid", 0) for info in sessions])
+        for info in sessions:
+            info["alive"] = info.get("pid", 0) in alive
         return _result(True, sessions=sessions)
 
     @staticmethod
@@ -492,14 +779,13 @@ with open(output, 'a') as out_f:
         if not info:
             return _result(False, error=f"会话 '{name}' 不存在")
 
-        pipe_dir = SESSION_DIR / name
+        pipe_dir = _get_session_dir(name)
         fifo_path = pipe_dir / "stdin.fifo"
 
         # 发送退出信号
         if not IS_WINDOWS and fifo_path.exists():
             try:
-                with open(fifo_path, "w") as f:
-                    f.write("__EXIT_SESSION__\n")
+                _fifo_send(fifo_path, b"__EXIT_SESSION__\n")
                 time.sleep(0.3)
             except (OSError, IOError):
                 pass
@@ -521,8 +807,7 @@ with open(output, 'a') as out_f:
     def close_all() -> str:
         import os, signal, shutil
 
-        for f in SESSION_DIR.glob("*.json"):
-            info = json.loads(f.read_text(encoding="utf-8"))
+        for info in _load_index().values():
             if info.get("pid", 0) > 0:
                 try:
                     os.kill(info["pid"], signal.SIGTERM)
@@ -558,6 +843,89 @@ def _exec_via_new_process(name: str, cmd: str, timeout: int, output_file: Path,
         return _result(False, error=str(e))
 
 
+def _alive_pids(pids) -> set[int]:
+    """批量检查进程是否存活：Linux 上一次读取 /proc，其他平台逐个 os.kill(pid, 0)"""
+    pids = {pid for pid in pids if pid > 0}
+    if not pids:
+        return set()
+    if platform.system() == "Linux":
+        try:
+            return pids & {int(p) for p in os.listdir("/proc") if p.isdigit()}
+        except OSError:
+            pass
+    alive = set()
+    for pid in pids:
+        try:
+            os.kill(pid, 0)
+            alive.add(pid)
+        except (OSError, ProcessLookupError):
+            pass
+    return alive
+
+
+def _adaptive_wait(condition_fn, timeout: float | None = None, initial: float = 0.02, max_interval: float = 0.5) -> bool:
+    """轮询 condition_fn 直到返回真或超时：首次间隔 initial，每次未命中翻倍直到 max_interval"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    interval = initial
+    while not condition_fn():
+        if deadline is None:
+            time.sleep(interval)
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+    return True
+
+
+@contextmanager
+def _watch_file(path: Path):
+    """监听文件写入，产出 wait(timeout) 函数：阻塞到文件被写入或超时。
+    Linux 优先用 inotify_simple，macOS/BSD 用 kqueue，否则回退到短间隔轮询"""
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        INotify = None
+
+    if INotify is not None:
+        inotify = INotify()
+        inotify.add_watch(str(path), flags.MODIFY)
+        try:
+            yield lambda timeout: inotify.read(timeout=int(timeout * 1000))
+        finally:
+            inotify.close()
+        return
+
+    import select
+    if hasattr(select, "kqueue"):
+        fd = os.open(str(path), os.O_RDONLY)
+        kq = select.kqueue()
+        try:
+            kq.control([select.kevent(
+                fd, filter=select.KQ_FILTER_VNODE,
+                flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND,
+            )], 0)
+            yield lambda timeout: kq.control(None, 1, timeout)
+        finally:
+            kq.close()
+            os.close(fd)
+        return
+
+    # 无通知机制时按文件大小变化自适应轮询
+    last_size = [path.stat().st_size]
+
+    def _grown() -> bool:
+        size = path.stat().st_size
+        if size == last_size[0]:
+            return False
+        last_size[0] = size
+        return True
+
+    yield lambda timeout: _adaptive_wait(_grown, timeout)
+
+
 # === 后端选择 ===
 
 def _get_backend():
@@ -571,14 +939,17 @@ def _get_backend():
 
 def _open_terminal_window(name: str) -> bool:
     """在系统终端窗口中打开 tmux 会话，返回是否成功"""
-    import subprocess
+    import shlex, subprocess
 
+    # xterm/konsole/osascript 接收的是交给 shell 执行的命令字符串
+    attach = f"{shlex.quote(_TMUX_BIN)} attach-session -t {shlex.quote(name)}"
     system = platform.system()
     if system == "Darwin":
-        # macOS: 用 Terminal.app 打开
+        # macOS: 用 Terminal.app 打开（AppleScript 字符串中需转义反斜杠与双引号）
+        quoted = attach.replace("\\", "\\\\").replace('"', '\\"')
         script = f'''
         tell application "Terminal"
-            do script "tmux attach-session -t {name}"
+            do script "{quoted}"
             activate
         end tell
         '''
@@ -590,9 +961,9 @@ def _open_terminal_window(name: str) -> bool:
     elif system == "Linux":
         # Linux: 尝试常见终端模拟器
         terminals = [
-            ["gnome-terminal", "--", "tmux", "attach-session", "-t", name],
-            ["xterm", "-e", f"tmux attach-session -t {name}"],
-            ["konsole", "-e", f"tmux attach-session -t {name}"],
+            ["gnome-terminal", "--", _TMUX_BIN, "attach-session", "-t", name],
+            ["xterm", "-e", attach],
+            ["konsole", "-e", attach],
         ]
         import shutil
         for cmd in terminals:
@@ -605,14 +976,34 @@ def _open_terminal_window(name: str) -> bool:
     return False
 
 
+# attach 空闲时检查会话与管道状态的间隔（秒）
+ATTACH_CHECK_INTERVAL = 5
+
+
+def _pane_alive(name: str) -> bool:
+    """会话存在且其窗格未退出"""
+    r = _tmux("display-message", "-t", name, "-p", "#{pane_dead}")
+    return r.returncode == 0 and r.stdout.strip() != "1"
+
+
+def _pipe_is_ours(tmp: str) -> bool:
+    """本次 attach 开启的 pipe-pane 进程是否仍在运行（tmux 替换或关闭管道时会结束它）。
+    无法列出进程时按仍在运行处理"""
+    import subprocess
+    try:
+        r = subprocess.run(["ps", "-A", "-o", "args="], capture_output=True, text=True)
+    except OSError:
+        return True
+    return r.returncode != 0 or tmp in r.stdout
+
+
 def _attach_session(name: str):
     """附着到会话：优先弹出系统终端窗口，回退到当前终端轮询"""
     backend = _get_backend()
 
     # tmux 后端
     if backend == TmuxBackend:
-        import subprocess
-        r = subprocess.run(["tmux", "has-session", "-t", name], capture_output=True)
+        r = _tmux("has-session", "-t", name)
         if r.returncode != 0:
             print(_result(False, error=f"会话 '{name}' 不存在"))
             return
@@ -622,31 +1013,46 @@ def _attach_session(name: str):
             print(_result(True, session=name, message=f"已在系统终端窗口中打开会话 '{name}'"))
             return
 
-        # 回退：当前终端轮询
+        # 回退：在当前终端显示。先输出当前屏幕内容，之后由 tmux pipe-pane
+        # 把新输出追加到临时文件并跟踪该文件，不再反复 capture-pane
+        import shlex, tempfile
+        fd, tmp = tempfile.mkstemp(prefix=f"attach-{os.getpid()}-", suffix=".log")
+        os.close(fd)
         print(f"[已附着到会话 '{name}'，Ctrl+C 退出]")
-        last_content = ""
+        print(_tmux("capture-pane", "-t", name, "-p").stdout.rstrip(), flush=True)
+        # 用 tee 而不是 cat >>，使临时文件路径出现在管道进程的 argv 中，便于识别管道归属
+        _tmux("pipe-pane", "-t", name, f"tee -a {shlex.quote(tmp)} > /dev/null")
         try:
-            while True:
-                r = subprocess.run(
-                    ["tmux", "capture-pane", "-t", name, "-p", "-S", "-100"],
-                    capture_output=True, text=True,
-                )
-                content = r.stdout.rstrip()
-                if content != last_content:
-                    if last_content and content.startswith(last_content):
-                        new_part = content[len(last_content):]
-                        if new_part:
-                            print(new_part, end="", flush=True)
-                    else:
-                        print(content, flush=True)
-                    last_content = content
-                time.sleep(0.3)
+            with open(tmp, "rb") as f:
+                pending = [b""]
+
+                def _read_new() -> bool:
+                    pending[0] = f.read()
+                    return bool(pending[0])
+
+                while True:
+                    if _adaptive_wait(_read_new, timeout=ATTACH_CHECK_INTERVAL):
+                        sys.stdout.buffer.write(pending[0])
+                        sys.stdout.buffer.flush()
+                        continue
+                    # 空闲一段时间后确认会话仍在、管道仍属于本次 attach
+                    if not _pane_alive(name):
+                        print(f"\n[会话 '{name}' 已结束]")
+                        break
+                    if not _pipe_is_ours(tmp):
+                        print(f"\n[会话 '{name}' 的输出管道已被其他 attach 接管]")
+                        break
         except KeyboardInterrupt:
             print(f"\n[已从会话 '{name}' 分离]")
+        finally:
+            # 不带命令调用 pipe-pane 即关闭管道；管道已被后来的 attach 替换时不去关闭它
+            if _pipe_is_ours(tmp):
+                _tmux("pipe-pane", "-t", name)
+            os.unlink(tmp)
         return
 
     # subprocess 后端：tail -f output.log
-    pipe_dir = SESSION_DIR / name
+    pipe_dir = _get_session_dir(name)
     output_file = pipe_dir / "output.log"
     if not output_file.exists():
         print(_result(False, error=f"会话 '{name}' 不存在"))
@@ -655,15 +1061,18 @@ def _attach_session(name: str):
     print(f"[已附着到会话 '{name}'，Ctrl+C 退出]")
     try:
         with open(output_file, "r", encoding="utf-8") as f:
-            content = f.read()
+            content = _strip_sentinels(f.read())
             if content:
                 print(content, end="", flush=True)
+            pending = [""]
+
+            def _read_new() -> bool:
+                pending[0] = f.read()
+                return bool(pending[0])
+
             while True:
-                line = f.readline()
-                if line:
-                    print(line, end="", flush=True)
-                else:
-                    time.sleep(0.2)
+                _adaptive_wait(_read_new)
+                print(_strip_sentinels(pending[0]), end="", flush=True)
     except KeyboardInterrupt:
         print(f"\n[已从会话 '{name}' 分离]")
 
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""subprocess 后端的会话守护进程：从 FIFO 读取命令，通过 shell 执行，输出写入 log"""
+
+import os
+import select
+import subprocess
+import sys
+
+
+def main(argv: list[str]):
+    fifo, output, shell, ready_fd = argv
+    ready_fd = int(ready_fd)
+
+    # 启动 shell 进程
+    with open(output, "a") as out_f:
+        proc = subprocess.Popen(
+            [shell],
+            stdin=subprocess.PIPE,
+            stdout=out_f,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        # FIFO 只打开一次；自己再持有一个写端，写者关闭后不会收到 EOF/POLLHUP，
+        # poll 无数据时阻塞，不占 CPU
+        fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        # 该描述符从不读写，只需在进程存活期间保持打开
+        _keep_writer = os.open(fifo, os.O_WRONLY)
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+
+        # 已可接收命令，通过握手管道告知父进程自己的 PID（父进程已超时放弃时忽略）
+        try:
+            os.write(ready_fd, f"{os.getpid()}\n".encode())
+        except OSError:
+            pass
+        os.close(ready_fd)
+
+        buf = b""
+        while True:
+            poller.poll()
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            *lines, buf = (buf + chunk).split(b"\n")
+            if not lines:
+                continue
+            exiting = b"__EXIT_SESSION__" in (line.strip() for line in lines)
+            if exiting:
+                lines = lines[:[line.strip() for line in lines].index(b"__EXIT_SESSION__")]
+            try:
+                proc.stdin.write(b"".join(line + b"\n" for line in lines))
+                proc.stdin.flush()
+            except (BrokenPipeError, OSError):
+                sys.exit(1)
+            if exiting:
+                proc.stdin.close()
+                proc.wait()
+                sys.exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,112 @@
+"""persistent_terminal 的后端回归测试"""
+
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "src" / "persistent-terminal" / "scripts"
+
+
+@pytest.fixture
+def pt(tmp_path, monkeypatch):
+    """在临时目录中导入模块（会话目录基于 cwd），tmux 使用独立的 socket 目录"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("TMUX", raising=False)
+    tmux_dir = tmp_path / "tmux"
+    tmux_dir.mkdir()
+    monkeypatch.setenv("TMUX_TMPDIR", str(tmux_dir))
+    monkeypatch.syspath_prepend(str(SCRIPTS_DIR))
+    sys.modules.pop("persistent_terminal", None)
+    module = importlib.import_module("persistent_terminal")
+    yield module
+    if shutil.which("tmux"):
+        subprocess.run(["tmux", "kill-server"], capture_output=True)
+
+
+@pytest.mark.skipif(not shutil.which("tmux"), reason="需要 tmux")
+def test_tmux_missing_session_with_server_running(pt):
+    B = pt.TmuxBackend
+    assert json.loads(B.create("alive"))["success"]
+
+    for result in (
+        B.exec_cmd("nosuch", "echo hi", 2),
+        B.send("nosuch", "hi"),
+        B.read("nosuch"),
+    ):
+        data = json.loads(result)
+        assert data == {"success": False, "error": "会话 'nosuch' 不存在"}
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 FIFO")
+def test_subprocess_exec_after_timeout_has_no_stale_sentinel(pt):
+    B = pt.SubprocessBackend
+    assert json.loads(B.create("s1"))["success"]
+    try:
+        timed_out = json.loads(B.exec_cmd("s1", "sleep 2; echo late", 1))
+        assert "warning" in timed_out
+
+        # 上一条命令仍在运行，它的完成标记会在本次 exec 期间写入日志
+        data = json.loads(B.exec_cmd("s1", "echo after", 10))
+        assert "__DONE_" not in data["output"]
+        assert data["output"].splitlines() == ["late", "after"]
+        assert "warning" not in data
+    finally:
+        B.close("s1")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 FIFO")
+def test_subprocess_sentinel_after_output_without_newline(pt):
+    B = pt.SubprocessBackend
+    assert json.loads(B.create("s4"))["success"]
+    try:
+        # 输出不以换行结尾时，完成标记会接在同一行末尾
+        assert json.loads(B.exec_cmd("s4", "printf foo", 10))["output"] == "foo"
+        assert json.loads(B.exec_cmd("s4", "echo bar", 10))["output"] == "bar"
+        assert "__DONE_" not in json.loads(B.read("s4", 10))["output"]
+
+        assert "warning" in json.loads(B.exec_cmd("s4", "sleep 2; printf late", 1))
+        data = json.loads(B.exec_cmd("s4", "echo after", 10))
+        assert "__DONE_" not in data["output"]
+        assert data["output"].endswith("after")
+    finally:
+        B.close("s4")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 FIFO")
+def test_close_removes_session_lock_file(pt):
+    B = pt.SubprocessBackend
+    assert json.loads(B.create("s2"))["success"]
+    assert json.loads(B.close("s2"))["success"]
+    json.loads(B.exec_cmd("nosuch", "echo hi", 1))
+
+    leftovers = [p.name for p in pt.SESSION_DIR.iterdir() if not p.name.startswith("_index.json")]
+    assert leftovers == []
+
+
+@pytest.mark.skipif(not Path("/proc/self/fd").is_dir(), reason="需要 /proc")
+def test_daemon_does_not_inherit_caller_fds(pt):
+    r, w = os.pipe()
+    os.set_inheritable(w, True)
+    B = pt.SubprocessBackend
+    try:
+        data = json.loads(B.create("s3"))
+        assert data["success"]
+        pid = json.loads(B.list_sessions())["sessions"][0]["pid"]
+        targets = {os.readlink(f"/proc/{pid}/fd/{fd}") for fd in os.listdir(f"/proc/{pid}/fd")}
+        assert os.readlink(f"/proc/self/fd/{w}") not in targets
+
+        # 守护进程不持有写端时，关闭本进程的写端后读端立即得到 EOF
+        os.close(w)
+        w = None
+        assert os.read(r, 1) == b""
+    finally:
+        B.close("s3")
+        os.close(r)
+        if w is not None:
+            os.close(w)